@@ -2,7 +2,6 @@
 import streamlit as st
 import requests
 import json
-import datetime
 import re
 import pandas as pd
 import time
@@ -13,27 +12,42 @@ import logging # <<< --- ADDED IMPORT --- >>>
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # --- Configuration ---
-BOT_API_URL = st.secrets.get("BOT_API_URL", None)
-API_KEY = st.secrets.get("BOT_API_KEY", None)
-HEADERS = {'X-API-Key': API_KEY} if API_KEY else {}
+from bot_api import BOT_API_URL, API_KEY, HISTORY_URL, get_session, parse_json
+HISTORY_REVALIDATE_INTERVAL = 5 # Seconds, when the API supplies an ETag
+HISTORY_CACHE_TTL = 60 # Seconds, when it does not
+PAGE_SIZE = 100 # Actions per page of the history table
+_URL_RE = re.compile(r'https?://\S+')
 
 # --- Helper Functions ---
 
-@st.cache_data(ttl=60)
 def fetch_history_data_from_api():
-    """Fetches the history data from the backend API."""
+    """Fetches the history data from the backend API, revalidating with the last ETag."""
     if not BOT_API_URL:
         st.error("🚨 BOT_API_URL secret is not configured.")
         return None
 
-    api_endpoint = f"{BOT_API_URL}/history"
+    # Reuse the last payload until it is due for revalidation
+    cached_profiles = st.session_state.get('_history_cache')
+    etag = st.session_state.get('_history_etag')
+    max_age = HISTORY_REVALIDATE_INTERVAL if etag else HISTORY_CACHE_TTL
+    if cached_profiles is not None and (time.time() - st.session_state.get('_history_fetch_time', 0)) < max_age:
+        return cached_profiles
+
+    api_endpoint = HISTORY_URL
     try:
-        response = requests.get(api_endpoint, headers=HEADERS, timeout=20)
+        conditional_headers = {'If-None-Match': etag} if etag and cached_profiles is not None else {}
+        response = get_session().get(api_endpoint, headers=conditional_headers, timeout=(3, 20))
+        if response.status_code == 304: # Unchanged since last fetch, skip download + parse
+            st.session_state._history_fetch_time = time.time()
+            return cached_profiles
         response.raise_for_status()
-        data = response.json()
+        data = parse_json(response)
         if isinstance(data, dict) and 'profiles' in data and isinstance(data['profiles'], dict):
             # Use logging correctly now
             logging.info(f"Successfully fetched history data for {len(data['profiles'])} profiles.")
+            st.session_state._history_cache = data['profiles']
+            st.session_state._history_etag = response.headers.get('ETag')
+            st.session_state._history_fetch_time = time.time()
             return data['profiles']
         else:
             st.error(f"API Error: Unexpected history data format received.")
@@ -60,53 +74,77 @@ def fetch_history_data_from_api():
         return None
 
 def get_combined_history(profiles_data):
-    # (Implementation remains the same)
-    all_actions = []
-    if not profiles_data: return all_actions
+    """Concatenates every profile's actions into one DataFrame tagged with `profile_id`."""
+    frames = []
+    if not profiles_data: return pd.DataFrame()
     for profile_id, data in profiles_data.items():
         actions = data.get('actions', [])
-        for action in actions:
-            action_copy = action.copy(); action_copy['profile_id'] = profile_id
-            all_actions.append(action_copy)
-    return all_actions
+        if actions:
+            df = pd.DataFrame(actions)
+            df['profile_id'] = profile_id
+            frames.append(df)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def add_parsed_timestamps(actions_df):
+    """Adds a UTC `timestamp_dt` column parsed in one vectorized pass (NaT if missing or unparseable)."""
+    if 'timestamp' in actions_df.columns: actions_df['timestamp_dt'] = pd.to_datetime(actions_df['timestamp'], utc=True, errors='coerce', format='ISO8601')
+    else: actions_df['timestamp_dt'] = pd.Series(pd.NaT, index=actions_df.index, dtype='datetime64[ns, UTC]')
+    return actions_df
+
+def filter_actions_by_time(actions_df, days):
+    """Keeps actions whose timestamp falls within the last `days` days."""
+    cutoff_time = pd.Timestamp.now(tz='UTC') - pd.Timedelta(days=days)
+    return actions_df[actions_df['timestamp_dt'] >= cutoff_time] # NaT compares False
 
-def filter_actions_by_time(actions, days):
-    # (Implementation remains the same)
-    if not actions: return []
-    filtered_actions = []
-    now = datetime.datetime.now()
-    cutoff_time = now - datetime.timedelta(days=days)
-    for action in actions:
-        try:
-            timestamp_str = action.get('timestamp')
-            if not timestamp_str: continue
-            timestamp_str = timestamp_str.replace('Z', '+00:00')
-            try: timestamp_dt = datetime.datetime.fromisoformat(timestamp_str)
-            except ValueError:
-                 try: timestamp_dt = datetime.datetime.strptime(timestamp_str, "%Y-%m-%dT%H:%M:%S.%f")
-                 except ValueError: timestamp_dt = datetime.datetime.strptime(timestamp_str, "%Y-%m-%dT%H:%M:%S")
-            if timestamp_dt.tzinfo: cutoff_time = cutoff_time.replace(tzinfo=timestamp_dt.tzinfo)
-            else: timestamp_dt = timestamp_dt.replace(tzinfo=None)
-            if timestamp_dt >= cutoff_time: filtered_actions.append(action)
-        except (ValueError, TypeError, KeyError) as e:
-             # Use logging correctly now
-             logging.debug(f"Skipping action due to timestamp parse error: {e}, Action: {action}")
-             continue
-    return filtered_actions
+def select_latest_actions(actions_df, limit):
+    """Returns the `limit` most recent actions, newest first, without sorting the whole frame."""
+    has_time = actions_df['timestamp_dt'].notna()
+    # Rank only rows with a parseable timestamp (nlargest would otherwise pad with NaT rows), list the rest last
+    latest = actions_df[has_time].nlargest(limit, 'timestamp_dt')
+    if len(latest) < limit:
+        latest = pd.concat([latest, actions_df[~has_time].head(limit - len(latest))])
+    return latest
 
 
-def display_action_details(details):
-    # (Implementation remains the same)
-    url_pattern = re.compile(r'https?://\S+')
-    urls_found = url_pattern.findall(details)
-    if urls_found:
-        url = urls_found[0]; text_part = details.replace(url, "").strip()
-        if text_part.endswith(':'): text_part = text_part[:-1].strip()
-        if text_part: st.write(f"{text_part}:")
-        display_url = url[:60] + "..." if len(url) > 60 else url
-        with st.expander(f"Link: `{display_url}`"):
-             st.markdown(f"[{url}]({url})", unsafe_allow_html=True)
-    else: st.write(details)
+def split_action_details(details):
+    """Splits action details into (text, first URL or None)."""
+    if 'http' not in details: return details, None # Most rows have no link, skip the regex
+    match = _URL_RE.search(details)
+    if not match: return details, None
+    text_part = (details[:match.start()] + details[match.end():]).strip()
+    if text_part.endswith(':'): text_part = text_part[:-1].strip()
+    return text_part, match.group(0)
+
+def build_actions_frame(actions_df, serial_lookup):
+    """Prepares the display columns of the actions DataFrame for st.dataframe."""
+    df = actions_df.copy()
+    for col in ('timestamp', 'action_type', 'details'):
+        if col not in df.columns: df[col] = 'N/A'
+    df = df.fillna({'timestamp': 'N/A', 'action_type': 'N/A', 'details': 'N/A'})
+    df['action_type'] = df['action_type'].astype(str).str.upper()
+    df[['details', 'link']] = pd.DataFrame(df['details'].astype(str).map(split_action_details).tolist(), index=df.index, columns=['details', 'link'])
+    if 'profile_id' in df.columns: df['serial_number'] = df['profile_id'].map(serial_lookup).fillna('N/A')
+    return df
+
+def build_profile_index(profiles_data):
+    """Returns (sorted profile ids, pid -> display name, pid -> serial number)."""
+    profile_ids = sorted(profiles_data) if profiles_data else []
+    profile_display_names, serial_lookup = {}, {}
+    for pid in profile_ids:
+        profile_info = profiles_data[pid].get('profile_info', {})
+        name = profile_info.get('name', 'N/A')
+        serial_number = profile_info.get('serial_number', 'N/A')
+        profile_display_names[pid] = f"{pid} ({name}, SN: {serial_number})"
+        serial_lookup[pid] = serial_number
+    return profile_ids, profile_display_names, serial_lookup
+
+def get_profile_index(profiles_data):
+    """Memoizes build_profile_index per history payload, so widget reruns skip the rebuild."""
+    # The payload object is only replaced when new history is downloaded, identity is enough
+    if st.session_state.get('_profile_index_src') is not profiles_data:
+        st.session_state._profile_index = build_profile_index(profiles_data)
+        st.session_state._profile_index_src = profiles_data
+    return st.session_state._profile_index
 
 # --- Streamlit Page Layout ---
 st.set_page_config(layout="wide", page_title="Bot History (Remote)")
@@ -140,13 +178,7 @@ st.sidebar.header("History View Controls")
 view_mode = st.sidebar.radio("View Mode:", ('Single Profile', 'All Profiles'), key='view_mode', horizontal=True)
 st.sidebar.markdown("---")
 
-profile_ids = sorted(list(profiles_data.keys())) if profiles_data else []
-profile_display_names = {}
-for pid in profile_ids:
-    profile_info = profiles_data.get(pid, {}).get('profile_info', {})
-    name = profile_info.get('name', 'N/A')
-    serial_number = profile_info.get('serial_number', 'N/A')
-    profile_display_names[pid] = f"{pid} ({name}, SN: {serial_number})"
+profile_ids, profile_display_names, serial_lookup = get_profile_index(profiles_data)
 
 if view_mode == 'Single Profile':
     st.sidebar.subheader("Single Profile Filter")
@@ -168,7 +200,7 @@ st.sidebar.divider()
 st.sidebar.info("Use sidebar navigation (top left) for other pages.")
 
 # --- Main Content Area ---
-actions_to_display = []
+actions_to_display = pd.DataFrame()
 if view_mode == 'Single Profile':
     if selected_profile_id and profiles_data and selected_profile_id in profiles_data:
         profile_data = profiles_data[selected_profile_id]
@@ -177,7 +209,7 @@ if view_mode == 'Single Profile':
         serial_number = profile_info.get('serial_number', 'N/A')
         st.caption(f"Displaying history for profile: **{selected_profile_id}**")
         st.markdown(f"**Name:** `{name}` | **Serial #:** `{serial_number}`")
-        actions_to_display = profile_data.get('actions', [])
+        actions_to_display = pd.DataFrame(profile_data.get('actions', []))
         with st.expander("Show Full Profile Information"): st.json(profile_info)
         st.divider()
     elif selected_profile_id:
@@ -194,73 +226,40 @@ elif view_mode == 'All Profiles':
         st.divider()
 else: st.error("Invalid view mode.")
 
+actions_to_display = add_parsed_timestamps(actions_to_display)
 filter_desc = ""
 if time_filter_option == 'Past 7 Days':
     actions_to_display = filter_actions_by_time(actions_to_display, days=7)
     filter_desc = " (Past 7 Days)"
 else: filter_desc = " (All Time)"
 
-if not actions_to_display:
+if actions_to_display.empty:
     st.info(f"No actions found for the selected criteria{filter_desc}.")
 else:
-    actions_to_display.sort(key=lambda x: x.get('timestamp', '0'), reverse=True)
-    st.write(f"**Total actions displayed: {len(actions_to_display)}**{filter_desc}")
+    total_actions = len(actions_to_display)
+    max_pages = (total_actions - 1) // PAGE_SIZE + 1
+    if st.session_state.get('history_page', 1) > max_pages: st.session_state.history_page = max_pages
+    page = st.sidebar.number_input("Page:", min_value=1, max_value=max_pages, step=1, key='history_page') # Defaults to min_value; no value= since the clamp above may set it via session_state
+    # Only the rows up to the end of the requested page are ranked, then the page is sliced off
+    actions_to_display = select_latest_actions(actions_to_display, page * PAGE_SIZE).iloc[(page - 1) * PAGE_SIZE:]
+    first_row = (page - 1) * PAGE_SIZE + 1
+    st.write(f"**Total actions: {total_actions}**{filter_desc} | Showing {first_row}-{first_row + len(actions_to_display) - 1} (page {page} of {max_pages})")
     st.markdown("---")
 
-    # Define columns based on view mode
-    if view_mode == 'All Profiles':
-        col_ts, col_pid, col_snum, col_type, col_details = st.columns([0.2, 0.12, 0.1, 0.13, 0.45])
-        # <<< --- FIXED SYNTAX --- >>>
-        with col_ts:
-            st.caption("**Timestamp**")
-        with col_pid:
-            st.caption("**Profile ID**")
-        with col_snum:
-             st.caption("**Serial #**")
-        with col_type:
-            st.caption("**Action Type**")
-        with col_details:
-            st.caption("**Details**")
-        st.markdown("---", unsafe_allow_html=True) # Header line
-    else: # Single Profile view
-        col_ts, col_type, col_details = st.columns([0.3, 0.15, 0.55])
-        # <<< --- FIXED SYNTAX --- >>>
-        with col_ts:
-            st.caption("**Timestamp**")
-        with col_type:
-            st.caption("**Action Type**")
-        with col_details:
-            st.caption("**Details**")
-        st.markdown("---", unsafe_allow_html=True) # Header line
-
-    # Display actions row by row
-    for action in actions_to_display:
-        timestamp = action.get('timestamp', 'N/A')
-        action_type = action.get('action_type', 'N/A')
-        details = action.get('details', 'N/A')
-        if view_mode == 'All Profiles':
-            profile_id_for_action = action.get('profile_id', 'N/A')
-            profile_info = profiles_data.get(profile_id_for_action, {}).get('profile_info', {})
-            serial_number = profile_info.get('serial_number', 'N/A')
-            col_ts, col_pid, col_snum, col_type, col_details = st.columns([0.2, 0.12, 0.1, 0.13, 0.45])
-            # <<< --- FIXED SYNTAX --- >>>
-            with col_ts:
-                st.markdown(f"`{timestamp}`")
-            with col_pid:
-                st.code(profile_id_for_action)
-            with col_snum:
-                st.code(serial_number)
-            with col_type:
-                st.markdown(f"**{action_type.upper()}**")
-            with col_details:
-                display_action_details(details)
-        else: # Single Profile view
-            col_ts, col_type, col_details = st.columns([0.3, 0.15, 0.55])
-            # <<< --- FIXED SYNTAX --- >>>
-            with col_ts:
-                st.markdown(f"`{timestamp}`")
-            with col_type:
-                st.markdown(f"**{action_type.upper()}**")
-            with col_details:
-                display_action_details(details)
-        st.markdown("---") # Separator between actions
\ No newline at end of file
+    actions_df = build_actions_frame(actions_to_display, serial_lookup)
+    if view_mode == 'All Profiles': display_cols = ['timestamp', 'profile_id', 'serial_number', 'action_type', 'details', 'link']
+    else: display_cols = ['timestamp', 'action_type', 'details', 'link']
+    st.dataframe(
+        actions_df[display_cols],
+        use_container_width=True,
+        height=600,
+        hide_index=True,
+        column_config={
+            'timestamp': "Timestamp",
+            'profile_id': "Profile ID",
+            'serial_number': "Serial #",
+            'action_type': "Action Type",
+            'details': "Details",
+            'link': st.column_config.LinkColumn("Link", max_chars=60),
+        },
+    )
@@ -0,0 +1,169 @@
+# front-engagement-bot/bot_api.py
+# Shared backend API client used by the dashboard and the pages.
+import streamlit as st
+import requests
+import time
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.util.request import ACCEPT_ENCODING
+
+# Try importing orjson for faster JSON decoding, stdlib json is used otherwise
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# --- Configuration ---
+BOT_API_URL = st.secrets.get("BOT_API_URL", None)
+API_KEY = st.secrets.get("BOT_API_KEY", None)
+HEADERS = MappingProxyType({'X-API-Key': API_KEY} if API_KEY else {}) # Read-only, shared by every page
+# Endpoint URLs, built once (None when BOT_API_URL is not configured)
+HISTORY_URL = f"{BOT_API_URL}/history" if BOT_API_URL else None
+STATUS_URL = f"{BOT_API_URL}/status" if BOT_API_URL else None
+LOGS_URL = f"{BOT_API_URL}/logs" if BOT_API_URL else None
+CONTROL_URL = f"{BOT_API_URL}/control" if BOT_API_URL else None
+SETTINGS_URL = f"{BOT_API_URL}/settings" if BOT_API_URL else None
+ALL_LOGS_URL = f"{BOT_API_URL}/all_logs" if BOT_API_URL else None
+API_TIMEOUT = (3, 5) # (connect, read) seconds for status/logs polls
+LOG_FETCH_MAX = 500 # Lines requested per poll
+LOG_BUFFER_MAX = 2000 # Lines kept in session state
+
+# --- Session ---
+@st.cache_resource
+def get_session():
+    """Returns a pooled requests.Session reused across reruns (HTTP keep-alive)."""
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    # Always ask for compressed bodies; the history and log JSON is highly repetitive.
+    # ACCEPT_ENCODING lists what urllib3 can decode here (gzip, deflate, plus br/zstd when installed)
+    session.headers.update({'Accept-Encoding': ACCEPT_ENCODING, 'Connection': 'keep-alive'})
+    # Short per-attempt timeouts plus quick retries ride out tunnel blips without stalling the page.
+    # Status/read retries are limited to GET so a control POST is never replayed; connect retries apply to all.
+    retry = Retry(total=2, connect=2, read=1, backoff_factor=0.2, status_forcelist=(502, 503, 504), allowed_methods=('GET',), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+# --- JSON ---
+def parse_json(response):
+    """Decodes a JSON response body; orjson parses the raw bytes directly.
+
+    orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers keep catching the latter.
+    """
+    return orjson.loads(response.content) if ORJSON_AVAILABLE else json.loads(response.content)
+
+def dump_json(data):
+    """Serializes a request body to UTF-8 JSON bytes (orjson when available)."""
+    if ORJSON_AVAILABLE: return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data).encode('utf-8')
+
+# --- ETag revalidation ---
+# Used from st.cache_data fetchers, whose results are shared by every session, so the last ETag and
+# parsed body per endpoint key are kept process-wide next to that cache rather than in st.session_state.
+# A 304 Not Modified then reuses the body without downloading or parsing it again.
+@st.cache_resource
+def _etag_store():
+    """cache_key -> (etag, body) for the last 200 response that carried an ETag."""
+    return {}
+
+def etag_headers(cache_key):
+    """If-None-Match header for the last ETag seen under cache_key (empty when nothing is stored)."""
+    entry = _etag_store().get(cache_key)
+    return {'If-None-Match': entry[0]} if entry else {}
+
+def etag_cached_body(cache_key):
+    """Body stored with the last ETag under cache_key, to return on a 304."""
+    entry = _etag_store().get(cache_key)
+    return entry[1] if entry else None
+
+def remember_etag_body(cache_key, response, body):
+    """Stores a freshly parsed body with the response's ETag (nothing is kept when the backend sends none)."""
+    etag = response.headers.get('ETag')
+    if etag: _etag_store()[cache_key] = (etag, body)
+
+# --- Bot Control / Status / Logs ---
+# These read and update st.session_state (bot_api_status, last_status_fetch_time, bot_logs, log_seq)
+def send_control_command(action):
+    if not BOT_API_URL: return None, "BOT_API_URL not set."
+    api_endpoint = CONTROL_URL; payload = {"action": action}
+    try:
+        response = get_session().post(api_endpoint, json=payload, timeout=(3, 15))
+        response.raise_for_status(); return parse_json(response), None
+    except requests.exceptions.RequestException as e:
+        error_detail = f"{type(e).__name__}"; 
+        try: error_detail += f": {e.response.json().get('error', e.response.text)}"
+        except: pass ; logging.error(f"API Control Error: {e}"); return None, f"API Error: {error_detail}"
+    except json.JSONDecodeError: logging.error("API Control Error: Invalid JSON"); return None, "Invalid JSON response."
+
+def fetch_status_from_api(pending=None):
+    if not BOT_API_URL: st.session_state.bot_api_status = {"state": "error", "details": "BOT_API_URL not set."}; return False
+    api_endpoint = STATUS_URL
+    try:
+        response = pending.result() if pending else get_session().get(api_endpoint, timeout=API_TIMEOUT); response.raise_for_status()
+        new_status = parse_json(response)
+        if isinstance(new_status, dict) and 'state' in new_status:
+             st.session_state.bot_api_status = new_status; st.session_state.last_status_fetch_time = time.time(); return True
+        else: st.session_state.bot_api_status = {"state": "error", "details": f"Invalid status format: {new_status}"}; logging.error(f"Invalid status: {new_status}"); return False
+    except requests.exceptions.RequestException as e:
+        error_prefix = f"({time.strftime('%H:%M:%S')}) Status Fail: "; error_msg = f"{error_prefix}{type(e).__name__}"
+        logging.warning(f"Status Fetch Fail: {e}"); st.session_state.bot_api_status["details"] = error_msg
+        st.session_state.bot_api_status["state"] = "error"; st.session_state.last_status_fetch_time = time.time(); return False
+    except json.JSONDecodeError: st.session_state.bot_api_status = {"state": "error", "details": "Invalid JSON status."}; logging.error("Invalid JSON status."); return False
+
+def reset_logs(placeholder):
+    """Replaces the log buffer with a placeholder line and rewinds the cursor, so the next fetch is a full snapshot."""
+    st.session_state.bot_logs = [placeholder]
+    st.session_state.log_seq = 0
+
+def logs_query_params():
+    """Query params asking /logs only for lines after the current cursor."""
+    return {'since': st.session_state.log_seq, 'max': LOG_FETCH_MAX}
+
+def fetch_logs_from_api(pending=None):
+    if not BOT_API_URL: logging.error("Cannot fetch logs: BOT_API_URL not set."); return False
+    api_endpoint = LOGS_URL
+    try:
+        response = pending.result() if pending else get_session().get(api_endpoint, params=logs_query_params(), timeout=API_TIMEOUT)
+        response.raise_for_status()
+        data = parse_json(response)
+        if isinstance(data, dict) and 'logs' in data and isinstance(data['logs'], list):
+             next_seq = data.get('next_seq')
+             if st.session_state.log_seq > 0 and isinstance(next_seq, int) and next_seq >= st.session_state.log_seq:
+                  # Delta response: append only the new lines, bounded to the last LOG_BUFFER_MAX
+                  st.session_state.bot_logs = (st.session_state.bot_logs + data['logs'])[-LOG_BUFFER_MAX:]
+                  st.session_state.log_seq = next_seq
+             else:
+                  # Full snapshot (first fetch since a reset, backend without cursor support, or its cursor was reset)
+                  st.session_state.bot_logs = data['logs'][-LOG_BUFFER_MAX:]
+                  st.session_state.log_seq = next_seq if isinstance(next_seq, int) else 0
+             logging.debug(f"Fetched {len(data['logs'])} log lines.")
+             return True
+        else:
+             logging.error(f"Invalid logs format from API: {data}")
+             reset_logs("--- Error fetching logs: Invalid format ---")
+             return False
+    except requests.exceptions.RequestException as e:
+        logging.warning(f"Logs Fetch Failed: {e}")
+        # Add error to logs list instead of replacing?
+        # st.session_state.bot_logs = [f"--- Error fetching logs: {type(e).__name__} ---"] + st.session_state.bot_logs[:100] # Keep some old logs
+        return False
+    except json.JSONDecodeError:
+         logging.error("Invalid JSON logs response from API.")
+         reset_logs("--- Error fetching logs: Invalid JSON ---")
+         return False
+
+def fetch_status_and_logs():
+    """Fetches /status and /logs concurrently so the two round-trips overlap."""
+    if not BOT_API_URL: return fetch_status_from_api(), fetch_logs_from_api()
+    session = get_session()
+    # Only the HTTP calls run in the pool; session_state is updated back on the script thread
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        status_pending = pool.submit(session.get, STATUS_URL, timeout=API_TIMEOUT)
+        logs_pending = pool.submit(session.get, LOGS_URL, params=logs_query_params(), timeout=API_TIMEOUT)
+    return fetch_status_from_api(status_pending), fetch_logs_from_api(logs_pending)
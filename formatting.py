@@ -0,0 +1,48 @@
+# front-engagement-bot/formatting.py
+# Display helpers shared by the pages.
+# Streamlit re-executes a page script as a fresh module on every rerun, so caches meant to
+# outlive a rerun are kept here, in an imported module.
+from datetime import datetime
+from functools import lru_cache
+
+@lru_cache(maxsize=4096)
+def pretty(key):
+    """Display label for a settings/stats key, e.g. 'open_rate' -> 'Open Rate'."""
+    return key.replace('_', ' ').title()
+
+@lru_cache(maxsize=4096)
+def widget_key(key_path):
+    """Streamlit widget key for a settings key path (a tuple)."""
+    return '_'.join(map(str, key_path))
+
+# --- Stat values ---
+# Formatters are resolved once per stat key (dispatch table) instead of re-testing the key on every call
+def _fmt_default(value): return str(value)
+def _fmt_pct(value): return f"{value:.1%}" if isinstance(value, float) else str(value)
+def _fmt_yes_no(value): return "Yes" if str(value).upper() == "TRUE" else "No"
+def _fmt_notes(value): return value[:150] + "..." if isinstance(value, str) and len(value) > 150 else str(value)
+def _fmt_date(value):
+    if not isinstance(value, str): return str(value)
+    try: return datetime.fromisoformat(value.replace('Z', '+00:00')).strftime('%Y-%m-%d %H:%M:%S')
+    except: return value # Keep original on parse error
+def _fmt_pct_or_date(value): return _fmt_date(value) if isinstance(value, str) else _fmt_pct(value) # Keys matching both, e.g. 'generated_date'
+
+_PCT_KEYS = frozenset({'open_rate', 'ad_click_rate'})
+_DATE_KEYS = frozenset({'last_interaction_date', 'last_newsletter_interaction_date'})
+_FORMATTERS = {k: _fmt_pct for k in _PCT_KEYS} | {k: _fmt_date for k in _DATE_KEYS} | {'is_email_active': _fmt_yes_no, 'notes': _fmt_notes}
+
+def _formatter_for(key):
+    fn = _FORMATTERS.get(key)
+    if fn is None: # Unknown key: classified by substring once per process
+        is_pct, is_date = 'rate' in key or 'ctr' in key, 'date' in key
+        if is_pct and is_date: fn = _fmt_pct_or_date # The value type decides, as before
+        elif is_pct: fn = _fmt_pct
+        elif is_date: fn = _fmt_date
+        else: fn = _fmt_default
+        _FORMATTERS[key] = fn
+    return fn
+
+def format_stat_value(key, value):
+    """Formats values for better display."""
+    if value is None: return "N/A"
+    return _formatter_for(key)(value)
@@ -2,22 +2,24 @@
 import streamlit as st
 import requests
 import json
-import time
 import logging
+import copy
 from collections import OrderedDict # Keep if render_setting relies on it
 
 # Try importing PyYAML for safe loading/dumping on the frontend if needed
 try:
     import yaml as pyyaml
     PYYAML_AVAILABLE = True
+    # Prefer the LibYAML C bindings when PyYAML was built with them
+    YAML_DUMPER = getattr(pyyaml, 'CSafeDumper', pyyaml.SafeDumper)
+    YAML_LOADER = getattr(pyyaml, 'CSafeLoader', pyyaml.SafeLoader)
 except ImportError:
     PYYAML_AVAILABLE = False
     logging.warning("PyYAML not installed. Cannot edit YAML fields like 'session_types'.")
 
 # --- Configuration ---
-BOT_API_URL = st.secrets.get("BOT_API_URL", None)
-API_KEY = st.secrets.get("BOT_API_KEY", None)
-HEADERS = {'X-API-Key': API_KEY} if API_KEY else {}
+from bot_api import BOT_API_URL, API_KEY, SETTINGS_URL, get_session, parse_json, dump_json, etag_headers, etag_cached_body, remember_etag_body
+from formatting import pretty, widget_key
 
 # --- Helper Functions ---
 
@@ -25,14 +27,17 @@ HEADERS = {'X-API-Key': API_KEY} if API_KEY else {}
 def fetch_settings_data_from_api():
     """Fetches the settings data from the backend API."""
     if not BOT_API_URL: return None, "BOT_API_URL secret is not configured."
-    api_endpoint = f"{BOT_API_URL}/settings"
+    api_endpoint = SETTINGS_URL
     try:
-        response = requests.get(api_endpoint, headers=HEADERS, timeout=15)
+        response = get_session().get(api_endpoint, headers=etag_headers('settings'), timeout=(3, 15))
+        if response.status_code == 304: # Unchanged on the backend, reuse the last body
+            return etag_cached_body('settings'), None
         response.raise_for_status()
-        settings_data = response.json()
+        settings_data = parse_json(response)
         # Ensure it's a dictionary
         if isinstance(settings_data, dict):
             logging.info("Settings fetched successfully.")
+            remember_etag_body('settings', response, settings_data)
             return settings_data, None
         else:
             logging.error(f"API Error: Settings format received is not a dictionary: {type(settings_data)}")
@@ -47,59 +52,84 @@ def fetch_settings_data_from_api():
         logging.error("API Settings Fetch Error: Invalid JSON response")
         return None, "Invalid settings JSON response from API."
 
-def save_settings_via_api(settings_data):
-    """Sends the updated settings dictionary to the backend API."""
-    if not BOT_API_URL: return False, "BOT_API_URL not set."
-    api_endpoint = f"{BOT_API_URL}/settings"
+def save_settings_via_api(changes, original_settings):
+    """Sends the changed settings leaves to the backend API (PATCH, full POST if PATCH is unsupported).
+
+    Returns (success, message, saved_settings); saved_settings is the API's copy when it sends one back.
+    """
+    if not BOT_API_URL: return False, "BOT_API_URL not set.", None
+    api_endpoint = SETTINGS_URL
+    json_headers = {'Content-Type': 'application/json'}
     try:
         # Make sure data being sent is basic Python types (dict, list, str, int, etc.)
-        response = requests.post(api_endpoint, headers=HEADERS, json=settings_data, timeout=20)
+        response = get_session().patch(api_endpoint, headers=json_headers, data=dump_json({'changes': changes}), timeout=(3, 20))
+        if response.status_code in (404, 405, 501): # Backend without partial updates, send the whole dict
+            updated_settings = apply_settings_changes(original_settings, changes)
+            response = get_session().post(api_endpoint, headers=json_headers, data=dump_json(updated_settings), timeout=(3, 20))
         response.raise_for_status()
-        return True, response.json().get("message", "Settings saved successfully.")
+        response_json = parse_json(response)
+        saved_settings = response_json.get("settings")
+        if not isinstance(saved_settings, dict): saved_settings = apply_settings_changes(original_settings, changes)
+        return True, response_json.get("message", "Settings saved successfully."), saved_settings
     except requests.exceptions.RequestException as e:
         error_detail = f"{type(e).__name__}"
         try: error_detail += f": {e.response.json().get('error', e.response.text)}"
         except: pass
         logging.error(f"API Settings Save Error: {e}")
-        return False, f"API Error saving settings: {error_detail}"
+        return False, f"API Error saving settings: {error_detail}", None
     except json.JSONDecodeError:
         logging.error("API Settings Save Error: Invalid JSON response")
-        return False, "Invalid JSON response from API after saving."
+        return False, "Invalid JSON response from API after saving.", None
 
 
 # --- Widget Rendering (render_setting) ---
+# Nesting indentation is a CSS class per level, the stylesheet is injected once per page run
+SETTING_INDENT_LEVELS = 6
+SETTING_INDENT_CSS = "<style>" + " ".join(f".lvl-{n} {{padding-left: {n}em}}" for n in range(SETTING_INDENT_LEVELS)) + "</style>"
+
+def _yaml_text(unique_key, value):
+    """YAML dump of `value`, re-dumped only when a different settings value is rendered."""
+    cache_key = f"_yaml_cache_{unique_key}"
+    if st.session_state.get(f"{cache_key}_src") is not value:
+        st.session_state[cache_key] = pyyaml.dump(value, indent=2, default_flow_style=False, Dumper=YAML_DUMPER)
+        st.session_state[f"{cache_key}_src"] = value
+    return st.session_state[cache_key]
+
 # Keep the function from your previous version (assuming it worked)
 # This function takes a python dict/list/value and renders the appropriate widget
 def render_setting(key_path, value, level=0):
     """Renders appropriate widget based on value type."""
     key = key_path[-1]
-    label = key.replace('_', ' ').title()
-    unique_key = '_'.join(map(str, key_path))
-    indent_html = " " * (level * 4)
+    label = pretty(key)
+    unique_key = widget_key(tuple(key_path))
+    indent_class = f"lvl-{min(level, SETTING_INDENT_LEVELS - 1)}" # Padding comes from SETTING_INDENT_CSS
 
     # Use columns for layout if not a dictionary itself
     if not isinstance(value, dict):
         col1, col2 = st.columns([0.4, 0.6]) # Adjust ratio as needed
         with col1:
-            st.markdown(f"{indent_html}{label}:", unsafe_allow_html=True)
+            st.markdown(f'<div class="{indent_class}">{label}:</div>', unsafe_allow_html=True)
     else: # For dictionaries, just render the header
-        st.markdown(f"{indent_html}**{label}:**", unsafe_allow_html=True)
+        st.markdown(f'<div class="{indent_class}"><b>{label}:</b></div>', unsafe_allow_html=True)
         col2 = st.container() # Use a container for widgets inside dict
 
     with col2: # Widget rendering happens here or below for dicts
         if isinstance(value, bool):
             st.checkbox("", value=value, key=unique_key, label_visibility="collapsed")
+            record_leaf(key_path, unique_key, 'bool')
         elif isinstance(value, int):
             min_val, max_val, step = None, None, 1
             if key == 'threads': min_val, max_val = 1, 4
             if 'interval' in key or 'wait' in key or 'age' in key: min_val = 0
             if key == 'backup_interval': min_val = 5
             st.number_input("", value=value, min_value=min_val, max_value=max_val, step=step, key=unique_key, label_visibility="collapsed")
+            record_leaf(key_path, unique_key, 'int')
         elif isinstance(value, float):
              min_val, max_val, step = None, None, 0.01
              if 'rate' in key or 'ctr' in key or 'probability' in key: min_val, max_val, step = 0.0, 1.0, 0.01
              elif key == 'random_variance': min_val, max_val, step = 0.0, 1.0, 0.05
              st.number_input("", value=value, min_value=min_val, max_value=max_val, step=step, format="%.2f", key=unique_key, label_visibility="collapsed")
+             record_leaf(key_path, unique_key, 'float')
         elif isinstance(value, str):
             if key == 'mode':
                 options = ["prod", "dev"]; index = options.index(value) if value in options else 0
@@ -111,58 +141,91 @@ def render_setting(key_path, value, level=0):
                  st.text_input("_(blank for all)_", value=str(value) if value is not None else "", key=unique_key, label_visibility="visible") # Label needed here
             elif 'path' in key or 'file' in key: st.text_input("", value=value, key=unique_key, label_visibility="collapsed", help="File path on server")
             else: st.text_input("", value=value, key=unique_key, label_visibility="collapsed")
+            record_leaf(key_path, unique_key, 'group_id' if key == 'group_id' else 'str')
         elif isinstance(value, list):
             list_keys_textarea = ['sender_email', 'ad_identifiers', 'regular_engagement_skip_senders', 'serial_numbers']
             if key in list_keys_textarea:
                 initial_text = "\n".join(map(str, value))
                 height = 60 + len(value) * 15
                 st.text_area(f"_(One per line)_", value=initial_text, height=min(height, 200), key=unique_key, label_visibility="visible")
+                record_leaf(key_path, unique_key, 'list_ints' if key == 'serial_numbers' else 'list_lines')
             elif key == 'session_types' and PYYAML_AVAILABLE and all(isinstance(item, dict) for item in value):
                  try:
-                     yaml_text = pyyaml.dump(value, indent=2, default_flow_style=False)
+                     yaml_text = _yaml_text(unique_key, value)
                      st.text_area(f"_(Edit as YAML)_", value=yaml_text, height=200, key=unique_key, label_visibility="visible", help="Edit list in YAML format.")
+                     record_leaf(key_path, unique_key, 'list_yaml')
                  except Exception as dump_err: st.error(f"Error preparing YAML for {key}: {dump_err}"); st.text_input("_(List - Error)_", value=str(value), disabled=True, key=unique_key, label_visibility="visible")
             elif key == 'session_types' and not PYYAML_AVAILABLE: st.warning("PyYAML needed to edit session_types."); st.text_input("_(List - Read Only)_", value=str(value), disabled=True, key=unique_key, label_visibility="visible")
             else: st.text_input(f"_(List - Read Only)_", value=str(value), disabled=True, key=unique_key, label_visibility="visible", help="Cannot edit this list type here.")
         elif isinstance(value, dict):
             st.markdown("---") # Separator before nested items
             for sub_key, sub_value in value.items(): render_setting(key_path + [sub_key], sub_value, level + 1)
-        elif value is None and key == 'group_id': st.text_input("_(blank for all)_", value="", key=unique_key, label_visibility="visible")
+        elif value is None and key == 'group_id': st.text_input("_(blank for all)_", value="", key=unique_key, label_visibility="visible"); record_leaf(key_path, unique_key, 'group_id')
         elif value is None: st.text_input("", value="None", disabled=True, key=unique_key, label_visibility="collapsed")
         else: st.text_input(f"_(Unknown Type: {type(value).__name__})_", value=str(value), disabled=True, key=unique_key, label_visibility="visible")
 
 # --- Update Logic ---
-# Keep the function from the previous plan to reconstruct the dict from st.session_state
-def build_updated_settings(original_data_structure, key_path):
-    """Recursively builds the updated settings dict from st.session_state."""
-    if isinstance(original_data_structure, dict):
-        updated_dict = {}
-        for key, original_value in original_data_structure.items():
-            current_key_path = key_path + [key]
-            if isinstance(original_value, dict):
-                updated_dict[key] = build_updated_settings(original_value, current_key_path)
-            else:
-                 widget_key = '_'.join(map(str, current_key_path))
-                 if widget_key in st.session_state:
-                     widget_value = st.session_state[widget_key]
-                     try: # Add more robust type conversion/parsing
-                         if isinstance(original_value, bool): updated_dict[key] = bool(widget_value)
-                         elif isinstance(original_value, int): updated_dict[key] = int(widget_value)
-                         elif isinstance(original_value, float): updated_dict[key] = float(widget_value)
-                         elif isinstance(original_value, list) and key in ['sender_email', 'ad_identifiers', 'regular_engagement_skip_senders']: updated_dict[key] = [line.strip() for line in widget_value.splitlines() if line.strip()]
-                         elif isinstance(original_value, list) and key == 'serial_numbers': updated_dict[key] = [int(line.strip()) for line in widget_value.splitlines() if line.strip().isdigit()]
-                         elif isinstance(original_value, list) and key == 'session_types' and PYYAML_AVAILABLE:
-                              parsed = pyyaml.safe_load(widget_value); updated_dict[key] = parsed if isinstance(parsed, list) else original_value
-                         elif key == 'group_id': updated_dict[key] = widget_value if widget_value else None
-                         elif isinstance(original_value, str): updated_dict[key] = str(widget_value)
-                         else: updated_dict[key] = widget_value # Fallback: assign widget value directly
-                     except Exception as e:
-                          st.warning(f"Error processing widget '{widget_key}' value '{widget_value}'. Keeping original. Error: {e}")
-                          logging.warning(f"Error processing widget {widget_key}: {e}")
-                          updated_dict[key] = original_value # Keep original on error
-                 else: updated_dict[key] = original_value # Keep original if no widget found
-        return updated_dict
-    else: return original_data_structure # Return non-dicts as is
+# render_setting records every editable leaf as widget key -> (key_path, kind) in
+# st.session_state['_leaf_index']; saving is then one pass over that index.
+def _parse_yaml_list(text):
+    parsed = pyyaml.load(text, Loader=YAML_LOADER)
+    if not isinstance(parsed, list): raise ValueError("expected a YAML list")
+    return parsed
+
+def _parse_lines(text):
+    """Non-empty lines of a textarea, each stripped once."""
+    return [line for line in map(str.strip, text.splitlines()) if line]
+
+def _parse_ints(text):
+    return [int(line) for line in _parse_lines(text) if line.isdigit()]
+
+_LEAF_PARSERS = {
+    'bool': bool,
+    'int': int,
+    'float': float,
+    'str': str,
+    'list_lines': _parse_lines,
+    'list_ints': _parse_ints,
+    'list_yaml': _parse_yaml_list,
+    'group_id': lambda value: value if value else None,
+}
+
+def reset_leaf_index(settings_data):
+    """Starts a new leaf index when a different settings payload is rendered."""
+    # Identity check: the payload object is only replaced on (re)load
+    if st.session_state.get('_leaf_index_src') is not settings_data:
+        st.session_state._leaf_index = {}
+        st.session_state._leaf_index_src = settings_data
+
+def record_leaf(key_path, unique_key, kind):
+    st.session_state._leaf_index.setdefault(unique_key, (tuple(key_path), kind))
+
+def _value_at(data, key_path):
+    for part in key_path: data = data[part]
+    return data
+
+def build_settings_changes(original_data, leaf_index):
+    """Returns [{'path': [...], 'value': ...}] for each edited leaf that differs from the loaded settings."""
+    changes = []
+    for wkey, (key_path, kind) in leaf_index.items():
+        if wkey not in st.session_state: continue
+        widget_value = st.session_state[wkey]
+        try: new_value = _LEAF_PARSERS[kind](widget_value)
+        except Exception as e:
+            st.warning(f"Error processing widget '{wkey}' value '{widget_value}'. Keeping original. Error: {e}")
+            logging.warning(f"Error processing widget {wkey}: {e}")
+            continue
+        # The loaded settings dict is never mutated, so it doubles as the snapshot of original values
+        if new_value != _value_at(original_data, key_path): changes.append({'path': list(key_path), 'value': new_value})
+    return changes
+
+def apply_settings_changes(original_data, changes):
+    """Returns a copy of the settings dict with the changes applied."""
+    updated = copy.deepcopy(original_data)
+    for change in changes:
+        *parent_path, leaf_key = change['path']
+        _value_at(updated, parent_path)[leaf_key] = change['value']
+    return updated
 
 
 # --- Streamlit Page ---
@@ -170,6 +233,7 @@ st.set_page_config(layout="wide", page_title="Settings Editor (Remote)")
 st.title("⚙️ Bot Settings Editor (Remote)")
 st.caption(f"Edit settings on the local machine via API: `{BOT_API_URL}`")
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+st.markdown(SETTING_INDENT_CSS, unsafe_allow_html=True)
 
 # --- Check API Config ---
 if not BOT_API_URL: st.error("🚨 Critical Error: BOT_API_URL secret is not set."); st.stop()
@@ -189,9 +253,9 @@ if st.session_state.current_settings_data is None:
          else:
              st.session_state.current_settings_data = settings_data
              st.session_state.settings_fetch_error = None # Clear error on success
-         st.rerun() # Rerun to display loaded data or error
+         # No rerun needed, the editor (or the error below) renders in this same run
 
-# Display error if fetch failed on previous run
+# Display error if the fetch failed
 if st.session_state.settings_fetch_error:
      st.error(f"Failed to load settings: {st.session_state.settings_fetch_error}")
      if st.button("🔄 Retry Loading Settings"):
@@ -202,6 +266,7 @@ if st.session_state.settings_fetch_error:
 # If data is loaded successfully
 settings_data = st.session_state.current_settings_data
 if settings_data:
+    reset_leaf_index(settings_data)
     with st.form(key="settings_form"):
         # Render settings using the recursive function within expanders for organization
         if 'global' in settings_data:
@@ -213,7 +278,7 @@ if settings_data:
                   nl_conf = settings_data['newsletters']
                   if isinstance(nl_conf, dict):
                       for nl_key, nl_value in nl_conf.items():
-                           st.markdown(f"**{nl_key.replace('_', ' ').title()} Config:**")
+                           st.markdown(f"**{pretty(nl_key)} Config:**")
                            render_setting(['newsletters', nl_key], nl_value, level=1) # level 1 inside expander
                            st.markdown("---")
         if 'engagement' in settings_data:
@@ -225,20 +290,21 @@ if settings_data:
         submitted = st.form_submit_button("💾 Save Settings to Bot", use_container_width=True, type="primary")
 
         if submitted:
-            logging.info("Save clicked. Building updated settings dict...")
-            updated_settings = build_updated_settings(settings_data, [])
-            # st.write("Updated Settings Payload:") # Debug: View payload
-            # st.json(updated_settings) # Debug: View payload
-            with st.spinner("Sending updated settings to the bot API..."):
-                 save_success, message = save_settings_via_api(updated_settings)
-            if save_success:
-                st.success(f"✅ {message}")
-                st.cache_data.clear() # Clear fetch cache
-                st.session_state.current_settings_data = None # Force reload
-                time.sleep(1)
-                st.rerun()
+            logging.info("Save clicked. Collecting changed settings...")
+            changes = build_settings_changes(settings_data, st.session_state._leaf_index)
+            # st.write("Changes Payload:") # Debug: View payload
+            # st.json(changes) # Debug: View payload
+            if not changes: st.info("No changes to save.")
             else:
-                st.error(f"❌ Failed to save settings: {message}")
+                with st.spinner(f"Sending {len(changes)} changed setting(s) to the bot API..."):
+                     save_success, message, saved_settings = save_settings_via_api(changes, settings_data)
+                if save_success:
+                    st.toast(f"✅ {message}")
+                    fetch_settings_data_from_api.clear() # Drop the stale cached copy
+                    # Use the saved settings directly instead of refetching; the next rerun renders from them
+                    st.session_state.current_settings_data = saved_settings
+                else:
+                    st.error(f"❌ Failed to save settings: {message}")
 else:
      # This case should ideally be handled by the error display above
      st.error("Could not load settings data to display the editor.")